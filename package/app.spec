@@ -30,9 +30,10 @@ hidden_imports = [
     'pydantic',
     'pydantic_settings',
     'passlib.handlers.bcrypt',
-    'jose',
+    'jwt',
     'openai',
     'httpx',
+    'orjson',
     'aiofiles',
     'sse_starlette',
     'redis',
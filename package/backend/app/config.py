@@ -66,6 +66,12 @@ class Settings(BaseSettings):
     # 流式输出配置
     USE_STREAMING: bool = False  # 默认使用非流式模式，避免被API阻止
     
+    # 日志配置
+    AI_REQUEST_LOGGING: bool = True  # 是否输出每次AI请求/响应的详细日志
+    
+    # 用户缓存配置
+    USER_CACHE_TTL: int = 30  # 卡密用户缓存时间（秒），多 worker 部署时建议设为 0 关闭缓存
+    
     # JWT 密钥
     SECRET_KEY: str = "your-secret-key-change-this-in-production"
     ALGORITHM: str = "HS256"
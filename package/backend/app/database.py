@@ -1,23 +1,50 @@
-from sqlalchemy import create_engine, inspect, text
+import threading
+from datetime import datetime
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {},
-    
-    # =========== 核心修改开始 ===========
-    # 显式增加连接池大小，以匹配 FastAPI 的并发能力
-    pool_size=50,          # 核心连接池保持 50 个连接
-    max_overflow=50,       # 允许临时突发增加 50 个连接 (总计 100)
-    pool_timeout=60,       # 排队等待超时时间设为 60 秒
-    pool_recycle=3600,     # 1小时回收一次连接，防止 MySQL 断连
-    pool_pre_ping=True     # 每次取连接前检测是否存活，防止 "MySQL server has gone away"
-    # =========== 核心修改结束 ===========
-)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+_is_sqlite = settings.DATABASE_URL.startswith("sqlite")
+
+# =========== 核心修改开始 ===========
+# 显式增加连接池大小，以匹配 FastAPI 的并发能力
+_engine_kwargs = {
+    "pool_size": 50,          # 核心连接池保持 50 个连接
+    "max_overflow": 50,       # 允许临时突发增加 50 个连接 (总计 100)
+    "pool_timeout": 60,       # 排队等待超时时间设为 60 秒
+}
+
+if _is_sqlite:
+    # SQLite 是本地文件，无需保活检测和定期回收连接；
+    # timeout 让写锁冲突时等待而不是立即报 "database is locked"
+    _engine_kwargs["connect_args"] = {"check_same_thread": False, "timeout": 30}
+else:
+    _engine_kwargs.update(
+        pool_recycle=1800,     # 30分钟回收一次连接，防止 MySQL/PostgreSQL 断连
+        pool_pre_ping=True,    # 每次取连接前检测是否存活，防止 "MySQL server has gone away"
+    )
+# =========== 核心修改结束 ===========
+
+engine = create_engine(settings.DATABASE_URL, **_engine_kwargs)
+
+if _is_sqlite:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """SQLite 连接优化：WAL 模式下读写互不阻塞，并减少每次提交的 fsync"""
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA cache_size=-64000")      # 约 64MB 页缓存
+            cursor.execute("PRAGMA mmap_size=268435456")    # 256MB 内存映射
+            cursor.execute("PRAGMA temp_store=MEMORY")
+        finally:
+            cursor.close()
+
+# expire_on_commit=False: 提交后保留对象的内存状态，序列化返回值时不再触发重新 SELECT
+# （需要读取其他会话改动时，请显式调用 db.refresh）
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 Base = declarative_base()
 
@@ -31,21 +58,64 @@ def get_db():
         db.close()
 
 
-def init_db():
-    """初始化数据库 - 安全地创建或更新数据库结构"""
+# 标记本进程是否已完成数据库初始化，避免重复建表与结构检查
+_db_initialized = False
+
+# 数据库结构版本号：修改模型、迁移逻辑或索引列表时必须递增。
+# 数据库中已记录相同版本时，启动时跳过建表、结构检查、迁移和建索引。
+SCHEMA_VERSION = 2
+_SCHEMA_VERSION_KEY = "schema_version"
+
+# 后台建索引：进程内锁防止重复启动；PostgreSQL 上另用 advisory lock 保证多 worker 只有一个在建
+_index_build_lock = threading.Lock()
+_INDEX_BUILD_ADVISORY_LOCK_ID = 727100
+
+
+def init_db(background_indexes: bool = True):
+    """初始化数据库 - 安全地创建或更新数据库结构（同一进程内只执行一次）
+    
+    Args:
+        background_indexes: 是否在后台线程中创建性能索引，不阻塞应用启动
+    """
+    global _db_initialized
+    if _db_initialized:
+        return True
+    
     try:
         # 导入所有模型以确保它们被注册到 Base.metadata
+        # （models 依赖本模块的 Base，不能提升到模块顶部导入，否则会循环导入）
         from app.models import models  # noqa: F401
         
+        # 结构版本一致说明表、字段和索引都已就绪，无需再检查
+        if _get_schema_version() == SCHEMA_VERSION:
+            _db_initialized = True
+            print("✓ 数据库结构已是最新版本")
+            return True
+        
         # 创建所有表（如果不存在）
         Base.metadata.create_all(bind=engine)
         
+        # 一次性缓存表结构信息，避免在迁移和建索引时重复查询系统表
+        inspector = inspect(engine)
+        tables = set(inspector.get_table_names())
+        cols_by_table = {t: {c["name"] for c in inspector.get_columns(t)} for t in tables}
+        idx_by_table = {t: {i["name"] for i in inspector.get_indexes(t)} for t in tables}
+        
         # 检查并添加可能缺失的列（用于数据库迁移）
-        _migrate_database_schema()
+        migrated = _migrate_database_schema(cols_by_table)
         
-        # 自动添加性能优化索引
-        _add_performance_indexes()
+        # 自动添加性能优化索引（首个请求并不依赖这些索引，默认放到后台创建）
+        if background_indexes:
+            threading.Thread(
+                target=_build_indexes_and_record_version,
+                args=(idx_by_table, migrated),
+                name="db-index-builder",
+                daemon=True
+            ).start()
+        else:
+            _build_indexes_and_record_version(idx_by_table, migrated)
         
+        _db_initialized = True
         print("✓ 数据库初始化成功")
         return True
     except Exception as e:
@@ -53,25 +123,87 @@ def init_db():
         raise
 
 
+def _build_indexes_and_record_version(idx_by_table, migrated: bool):
+    """创建性能索引；迁移和建索引都成功时才记录结构版本，否则下次启动重试"""
+    if not _index_build_lock.acquire(blocking=False):
+        return
+    try:
+        if _add_performance_indexes(idx_by_table) and migrated:
+            _set_schema_version(SCHEMA_VERSION)
+    finally:
+        _index_build_lock.release()
+
+
+def _get_schema_version() -> int:
+    """读取数据库中记录的结构版本，未记录或表不存在时返回 0"""
+    try:
+        with engine.connect() as conn:
+            value = conn.execute(
+                text("SELECT value FROM system_settings WHERE key = :key"),
+                {"key": _SCHEMA_VERSION_KEY}
+            ).scalar()
+        return int(value) if value is not None else 0
+    except Exception:
+        return 0
+
+
+def _set_schema_version(version: int):
+    """记录当前结构版本（存放在 system_settings 表中）"""
+    try:
+        params = {"key": _SCHEMA_VERSION_KEY, "value": str(version), "now": datetime.utcnow()}
+        with engine.begin() as conn:
+            updated = conn.execute(
+                text("UPDATE system_settings SET value = :value, updated_at = :now WHERE key = :key"),
+                params
+            ).rowcount
+            if not updated:
+                conn.execute(
+                    text("INSERT INTO system_settings (key, value, updated_at) VALUES (:key, :value, :now)"),
+                    params
+                )
+    except Exception as e:
+        print(f"  ⚠ 记录数据库结构版本警告: {str(e)}")
+
+
+def _begin_sqlite_ddl(conn):
+    """在 SQLite 上显式开启写事务
+    
+    pysqlite 默认只在 DML 前自动 BEGIN，DDL（ALTER/CREATE INDEX）和 SAVEPOINT
+    会各自立即提交；显式 BEGIN IMMEDIATE 后整批语句才会在一次提交中落盘。
+    """
+    if _is_sqlite:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
 def _add_column_safely(conn, table_name, column_name, column_def):
-    """安全地添加列（如果不存在）"""
+    """安全地添加列（如果不存在）
+    
+    在调用方已开启的事务中执行，不单独提交；用 SAVEPOINT 隔离失败，
+    单条 ALTER 出错不会中断整个迁移事务。
+    """
     try:
-        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_def}"))
-        conn.commit()
+        with conn.begin_nested():
+            conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_def}")
         return True
     except Exception as e:
         # 列可能已存在或其他错误
-        conn.rollback()
         return False
 
 
-def _add_performance_indexes():
-    """添加性能优化索引"""
+def _add_performance_indexes(idx_by_table) -> bool:
+    """添加性能优化索引
+    
+    Args:
+        idx_by_table: 表名 -> 已有索引名集合 的缓存
+    
+    Returns:
+        是否全部成功
+    """
     try:
-        inspector = inspect(engine)
-        tables = inspector.get_table_names()
+        # 布尔字面量：PostgreSQL 需要 TRUE，SQLite 中布尔值存为 1
+        true_literal = "TRUE" if engine.dialect.name == "postgresql" else "1"
         
-        # 定义需要的索引
+        # 定义需要的索引: (索引名, 表名, 列, [部分索引条件])
         indexes = [
             # OptimizationSession indexes
             ("idx_opt_session_user_id", "optimization_sessions", "user_id"),
@@ -87,110 +219,159 @@ def _add_performance_indexes():
             ("idx_change_log_session_id", "change_logs", "session_id"),
             ("idx_change_log_segment_index", "change_logs", "segment_index"),
             ("idx_change_log_stage", "change_logs", "stage"),
+            
+            # CustomPrompt indexes（第三项可以是逗号分隔的多列，用于复合索引）
+            ("idx_custom_prompts_user_stage_default", "custom_prompts", "user_id, stage, is_default"),
+            ("idx_custom_prompts_is_system", "custom_prompts", "is_system"),
+            # 部分索引只包含默认提示词，"取消其他默认"的更新只需扫描极少的行
+            ("idx_custom_prompts_default_partial", "custom_prompts", "user_id, stage",
+             f"is_default = {true_literal}"),
         ]
         
-        with engine.connect() as conn:
-            for index_name, table_name, column_name in indexes:
-                # 检查表是否存在
-                if table_name not in tables:
-                    continue
-                
-                try:
-                    # 获取表上现有的索引
-                    existing_indexes = inspector.get_indexes(table_name)
-                    index_names = {idx['name'] for idx in existing_indexes}
-                    
-                    # 如果索引已存在，跳过
-                    if index_name in index_names:
-                        continue
-                    
-                    # 创建索引（SQLite 和 PostgreSQL 都支持相同语法）
-                    conn.execute(text(
-                        f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({column_name})"
-                    ))
-                    conn.commit()
-                    print(f"  ✓ 添加索引: {index_name}")
-                    
-                except Exception as e:
-                    # 索引可能已存在或其他错误
-                    conn.rollback()
-                    # 静默失败，不阻止应用启动
-                    pass
+        # 过滤掉表不存在或索引已存在的项
+        pending = [
+            index for index in indexes
+            if index[1] in idx_by_table and index[0] not in idx_by_table[index[1]]
+        ]
+        if not pending:
+            return True
+        
+        if engine.dialect.name == "postgresql":
+            if not _create_indexes_concurrently(pending):
+                return False
+        else:
+            # 在同一个事务中创建所有索引，只提交一次
+            with engine.begin() as conn:
+                _begin_sqlite_ddl(conn)
+                for index in pending:
+                    conn.exec_driver_sql(_create_index_sql(*index))
+        
+        for index_name, *_ in pending:
+            print(f"  ✓ 添加索引: {index_name}")
+        return True
     
     except Exception as e:
         print(f"  ⚠ 添加性能索引警告: {str(e)}")
         # 失败不应该阻止应用启动
+        return False
+
 
+def _create_index_sql(index_name, table_name, column_name, where=None, concurrently=False):
+    """生成 CREATE INDEX 语句，where 不为空时生成部分索引"""
+    sql = (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS "
+        f"{index_name} ON {table_name} ({column_name})"
+    )
+    if where:
+        sql += f" WHERE {where}"
+    return sql
 
-def _migrate_database_schema():
-    """迁移数据库结构 - 添加新列到已存在的表"""
+
+def _create_indexes_concurrently(pending) -> bool:
+    """PostgreSQL：用 CREATE INDEX CONCURRENTLY 建索引，不锁表写入
+    
+    CONCURRENTLY 不能在事务中执行，因此使用 AUTOCOMMIT 连接逐条创建。
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # 多 worker 部署时只允许一个进程建索引
+        locked = conn.exec_driver_sql(
+            f"SELECT pg_try_advisory_lock({_INDEX_BUILD_ADVISORY_LOCK_ID})"
+        ).scalar()
+        if not locked:
+            print("  ⚠ 其他进程正在创建索引，跳过")
+            return False
+        try:
+            for index in pending:
+                conn.exec_driver_sql(_create_index_sql(*index, concurrently=True))
+        finally:
+            conn.exec_driver_sql(f"SELECT pg_advisory_unlock({_INDEX_BUILD_ADVISORY_LOCK_ID})")
+    return True
+
+
+def _add_columns_safely(conn, table_name, columns):
+    """批量添加同一张表缺失的列
+    
+    整批 ALTER 放在一个 SAVEPOINT 中执行；整批失败时退回逐列添加，
+    避免一列出错导致其余列也加不上。
+    
+    Args:
+        columns: [(列名, 列定义), ...]
+    
+    Returns:
+        成功添加的列名列表
+    """
+    if not columns:
+        return []
     try:
-        inspector = inspect(engine)
-        
-        # 检查表是否存在
-        tables = inspector.get_table_names()
-        
-        with engine.connect() as conn:
+        with conn.begin_nested():
+            for column_name, column_def in columns:
+                conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_def}")
+        return [column_name for column_name, _ in columns]
+    except Exception:
+        return [
+            column_name
+            for column_name, column_def in columns
+            if _add_column_safely(conn, table_name, column_name, column_def)
+        ]
+
+
+def _migrate_database_schema(cols_by_table) -> bool:
+    """迁移数据库结构 - 添加新列到已存在的表
+    
+    Args:
+        cols_by_table: 表名 -> 已有列名集合 的缓存
+    
+    Returns:
+        是否成功（单个字段添加失败不影响结果）
+    """
+    # 各表后续新增的列: 表名 -> [(列名, 列定义), ...]
+    column_migrations = {
+        "optimization_sessions": [
+            ("failed_segment_index", "INTEGER"),
+            ("processing_mode", "VARCHAR(50) DEFAULT 'paper_polish_enhance'"),
+            ("emotion_model", "VARCHAR(100)"),
+            ("emotion_api_key", "VARCHAR(255)"),
+            ("emotion_base_url", "VARCHAR(255)"),
+        ],
+        "users": [
+            ("usage_limit", f"INTEGER DEFAULT {settings.DEFAULT_USAGE_LIMIT}"),
+            ("usage_count", "INTEGER DEFAULT 0"),
+        ],
+        "optimization_segments": [
+            ("is_title", "BOOLEAN DEFAULT 0"),
+        ],
+        "custom_prompts": [
+            ("is_system", "BOOLEAN DEFAULT 0"),
+            ("is_active", "BOOLEAN DEFAULT 1"),
+        ],
+    }
+    
+    try:
+        # 所有迁移语句在同一个事务中执行，只提交一次
+        with engine.begin() as conn:
+            _begin_sqlite_ddl(conn)
             
-                # 迁移 optimization_sessions 表
-                if "optimization_sessions" in tables:
-                    columns = {column["name"] for column in inspector.get_columns("optimization_sessions")}
-                    
-                    if "failed_segment_index" not in columns:
-                        if _add_column_safely(conn, "optimization_sessions", "failed_segment_index", "INTEGER"):
-                            print("  ✓ 添加字段: optimization_sessions.failed_segment_index")
-                    
-                    if "processing_mode" not in columns:
-                        if _add_column_safely(conn, "optimization_sessions", "processing_mode", "VARCHAR(50) DEFAULT 'paper_polish_enhance'"):
-                            print("  ✓ 添加字段: optimization_sessions.processing_mode")
-                    
-                    if "emotion_model" not in columns:
-                        added = _add_column_safely(conn, "optimization_sessions", "emotion_model", "VARCHAR(100)")
-                        _add_column_safely(conn, "optimization_sessions", "emotion_api_key", "VARCHAR(255)")
-                        _add_column_safely(conn, "optimization_sessions", "emotion_base_url", "VARCHAR(255)")
-                        if added:
-                            print("  ✓ 添加字段: optimization_sessions.emotion_* 字段")
+            for table_name, columns in column_migrations.items():
+                # 检查表是否存在
+                if table_name not in cols_by_table:
+                    continue
+                
+                existing = cols_by_table[table_name]
+                missing = [(name, definition) for name, definition in columns if name not in existing]
+                for column_name in _add_columns_safely(conn, table_name, missing):
+                    print(f"  ✓ 添加字段: {table_name}.{column_name}")
             
-                # 迁移 users 表
-                if "users" in tables:
-                    user_columns = {column["name"] for column in inspector.get_columns("users")}
-                    
-                    if "usage_limit" not in user_columns:
-                        if _add_column_safely(conn, "users", "usage_limit", f"INTEGER DEFAULT {settings.DEFAULT_USAGE_LIMIT}"):
-                            print("  ✓ 添加字段: users.usage_limit")
-                    
-                    if "usage_count" not in user_columns:
-                        if _add_column_safely(conn, "users", "usage_count", "INTEGER DEFAULT 0"):
-                            print("  ✓ 添加字段: users.usage_count")
-                    
-                    # 更新 NULL 值
-                    try:
+            # 更新 users 表中的 NULL 值
+            if "users" in cols_by_table:
+                try:
+                    with conn.begin_nested():
                         conn.execute(text(f"UPDATE users SET usage_limit = {settings.DEFAULT_USAGE_LIMIT} WHERE usage_limit IS NULL"))
                         conn.execute(text("UPDATE users SET usage_count = 0 WHERE usage_count IS NULL"))
-                        conn.commit()
-                    except Exception:
-                        conn.rollback()
-            
-                # 迁移 optimization_segments 表
-                if "optimization_segments" in tables:
-                    segment_columns = {column["name"] for column in inspector.get_columns("optimization_segments")}
-                    
-                    if "is_title" not in segment_columns:
-                        if _add_column_safely(conn, "optimization_segments", "is_title", "BOOLEAN DEFAULT 0"):
-                            print("  ✓ 添加字段: optimization_segments.is_title")
-            
-                # 迁移 custom_prompts 表
-                if "custom_prompts" in tables:
-                    prompt_columns = {column["name"] for column in inspector.get_columns("custom_prompts")}
-                    
-                    if "is_system" not in prompt_columns:
-                        if _add_column_safely(conn, "custom_prompts", "is_system", "BOOLEAN DEFAULT 0"):
-                            print("  ✓ 添加字段: custom_prompts.is_system")
-                    
-                    if "is_active" not in prompt_columns:
-                        if _add_column_safely(conn, "custom_prompts", "is_active", "BOOLEAN DEFAULT 1"):
-                            print("  ✓ 添加字段: custom_prompts.is_active")
+                except Exception:
+                    pass
+        return True
     
     except Exception as e:
         print(f"  ⚠ 数据库迁移警告: {str(e)}")
         # 迁移失败不应该阻止应用启动
+        return False
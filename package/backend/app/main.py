@@ -14,7 +14,7 @@ from app.database import init_db
 from app.routes import admin, prompts, optimization
 from app.models.models import CustomPrompt
 from app.database import SessionLocal
-from app.services.ai_service import get_default_polish_prompt, get_default_enhance_prompt
+from app.services.ai_service import get_default_polish_prompt, get_default_enhance_prompt, close_http_client
 
 
 # 响应缓存头中间件 - 优化浏览器缓存
@@ -140,6 +140,13 @@ async def startup_event():
         db.close()
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """关闭时释放资源"""
+    # 关闭 AI 服务共享的 HTTP 连接池
+    await close_http_client()
+
+
 @app.get("/")
 async def root():
     """根路径"""
@@ -25,6 +25,7 @@ from app.schemas import (
     UserUsageUpdate,
 )
 from app.services.concurrency import concurrency_manager
+from app.services.user_cache import invalidate_user_cache
 from app.utils.auth import (
     create_access_token,
     generate_access_link,
@@ -206,6 +207,7 @@ async def toggle_user_status(
     user.is_active = not user.is_active
     db.commit()
     db.refresh(user)
+    invalidate_user_cache(user.card_key)
     return {
         "id": user.id,
         "card_key": user.card_key,
@@ -230,6 +232,7 @@ async def update_user_usage(
         user.usage_count = 0
     db.commit()
     db.refresh(user)
+    invalidate_user_cache(user.card_key)
     return {
         "id": user.id,
         "usage_limit": user.usage_limit,
@@ -274,6 +277,7 @@ async def delete_user(
 
     db.delete(user)
     db.commit()
+    invalidate_user_cache(user.card_key)
     return {"message": "用户已删除", "card_key": user.card_key}
 
 
@@ -855,6 +859,8 @@ async def update_table_record(
 
     db.commit()
     db.refresh(record)
+    if model is User:
+        invalidate_user_cache()
     return {"message": "记录已更新", "record": _model_to_dict(record)}
 
 
@@ -875,4 +881,6 @@ async def delete_table_record(
 
     db.delete(record)
     db.commit()
+    if model is User:
+        invalidate_user_cache()
     return {"message": "记录已删除"}
@@ -1,20 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import bindparam, delete, lambda_stmt, or_, select, update
+from sqlalchemy.orm import Session, aliased, load_only
+from sqlalchemy.orm.exc import StaleDataError
 from typing import List
 from app.database import get_db
 from app.models.models import User, CustomPrompt
-from app.schemas import PromptCreate, PromptUpdate, PromptResponse
+from app.schemas import PromptCreate, PromptUpdate, PromptResponse, PromptListItem, PromptListAdapter
+from app.services.user_cache import cache_user, get_cached_user, invalidate_user_cache
 from datetime import datetime
 
 router = APIRouter(prefix="/prompts", tags=["prompts"])
 
+# 最后使用时间的最小更新间隔（秒），避免每次读请求都触发一次写事务
+LAST_USED_UPDATE_INTERVAL = 60
+
+# 固定结构的语句用 lambda_stmt 在模块级构建，按代码位置缓存，参数通过 bindparam 传入，
+# 每次请求无需重新构建语句和计算缓存键
+_USER_BY_CARD_KEY_STMT = lambda_stmt(lambda: select(User).where(
+    User.card_key == bindparam("card_key"),
+    User.is_active == True
+).limit(1))
+
 
 def get_current_user(card_key: str, db: Session = Depends(get_db)) -> User:
     """获取当前用户"""
-    user = db.query(User).filter(
-        User.card_key == card_key,
-        User.is_active == True
-    ).first()
+    user = get_cached_user(card_key, db)
+    from_cache = user is not None
+    
+    if user is None:
+        user = db.execute(_USER_BY_CARD_KEY_STMT, {"card_key": card_key}).scalar()
     
     if not user:
         raise HTTPException(
@@ -22,24 +36,120 @@ def get_current_user(card_key: str, db: Session = Depends(get_db)) -> User:
             detail="无效的卡密"
         )
     
-    # 更新最后使用时间
-    user.last_used = datetime.utcnow()
-    db.commit()
+    # 更新最后使用时间（间隔不足时跳过写入）
+    now = datetime.utcnow()
+    last_used_updated = False
+    if not user.last_used or (now - user.last_used).total_seconds() >= LAST_USED_UPDATE_INTERVAL:
+        user.last_used = now
+        try:
+            db.commit()
+        except StaleDataError:
+            if not from_cache:
+                raise
+            # 缓存的用户已被删除（例如在其他 worker 中），UPDATE 未命中任何行：按缓存未命中处理
+            db.rollback()
+            if user in db:
+                db.expunge(user)
+            invalidate_user_cache(card_key)
+            return get_current_user(card_key, db)
+        last_used_updated = True
+    
+    # 只有真正查询过数据库才写入新的缓存项；命中缓存时只刷新快照中的 last_used 并保留原过期时间，
+    # 否则持续使用的卡密永远不会重新查库，在其他 worker 中被禁用或删除后仍可一直使用
+    if not from_cache:
+        cache_user(card_key, user)
+    elif last_used_updated:
+        cache_user(card_key, user, keep_expiry=True)
     
     return user
 
 
-@router.get("/system", response_model=List[PromptResponse])
-async def get_system_prompts(db: Session = Depends(get_db)):
+# 将指定提示词设为该阶段默认，并取消同阶段其他默认提示词
+_SET_STAGE_DEFAULT_STMT = lambda_stmt(lambda: update(CustomPrompt).where(
+    CustomPrompt.user_id == bindparam("uid"),
+    CustomPrompt.stage == bindparam("b_stage"),
+    or_(CustomPrompt.is_default == True, CustomPrompt.id == bindparam("pid"))
+).values(is_default=CustomPrompt.id == bindparam("pid")))
+
+# 同上，但阶段由子查询从目标提示词取得，存在性检查与切换默认合并为一条 UPDATE
+_target_prompt = aliased(CustomPrompt)
+_SET_DEFAULT_BY_ID_STMT = lambda_stmt(lambda: update(CustomPrompt).where(
+    CustomPrompt.user_id == bindparam("uid"),
+    CustomPrompt.stage == select(_target_prompt.stage).where(
+        _target_prompt.id == bindparam("pid"),
+        _target_prompt.user_id == bindparam("uid")
+    ).scalar_subquery(),
+    or_(CustomPrompt.is_default == True, CustomPrompt.id == bindparam("pid"))
+).values(is_default=CustomPrompt.id == bindparam("pid")))
+
+_DELETE_PROMPT_STMT = lambda_stmt(lambda: delete(CustomPrompt).where(
+    CustomPrompt.id == bindparam("pid"),
+    CustomPrompt.user_id == bindparam("uid")
+))
+
+_GET_PROMPT_STMT = lambda_stmt(lambda: select(CustomPrompt).where(
+    CustomPrompt.id == bindparam("pid"),
+    or_(CustomPrompt.user_id == bindparam("uid"), CustomPrompt.is_system == True)
+))
+
+# 批量 UPDATE/DELETE 后不同步会话中的对象
+_NO_SYNC = {"synchronize_session": False}
+
+
+def _set_stage_default(db: Session, user_id: int, stage: str, prompt_id: int) -> int:
+    """用一条 UPDATE 将指定提示词设为该阶段默认，并取消同阶段其他默认提示词，返回受影响的行数"""
+    return db.execute(
+        _SET_STAGE_DEFAULT_STMT,
+        {"uid": user_id, "b_stage": stage, "pid": prompt_id},
+        execution_options=_NO_SYNC
+    ).rowcount
+
+
+# 列表接口只加载元数据列，正文 content 可能很大，按需通过详情接口获取
+_PROMPT_LIST_COLUMNS = load_only(
+    CustomPrompt.id,
+    CustomPrompt.user_id,
+    CustomPrompt.name,
+    CustomPrompt.stage,
+    CustomPrompt.is_default,
+    CustomPrompt.is_system,
+    CustomPrompt.is_active,
+    CustomPrompt.created_at,
+    CustomPrompt.updated_at
+)
+
+
+_SYSTEM_PROMPTS_STMT = lambda_stmt(lambda: select(CustomPrompt).options(_PROMPT_LIST_COLUMNS).where(
+    CustomPrompt.is_system == True
+))
+
+_USER_PROMPTS_STMT = lambda_stmt(lambda: select(CustomPrompt).options(_PROMPT_LIST_COLUMNS).where(
+    CustomPrompt.user_id == bindparam("uid")
+))
+
+_USER_STAGE_PROMPTS_STMT = lambda_stmt(lambda: select(CustomPrompt).options(_PROMPT_LIST_COLUMNS).where(
+    CustomPrompt.user_id == bindparam("uid"),
+    CustomPrompt.stage == bindparam("b_stage")
+))
+
+
+def _prompt_list_response(prompts: List[CustomPrompt]) -> Response:
+    """用预构建的适配器直接序列化提示词列表，跳过 FastAPI 的二次校验"""
+    return Response(
+        content=PromptListAdapter.dump_json(PromptListAdapter.validate_python(prompts)),
+        media_type="application/json"
+    )
+
+
+@router.get("/system", response_model=List[PromptListItem])
+def get_system_prompts(db: Session = Depends(get_db)):
     """获取系统预设提示词"""
-    prompts = db.query(CustomPrompt).filter(
-        CustomPrompt.is_system == True
-    ).all()
-    return prompts
+    prompts = db.execute(_SYSTEM_PROMPTS_STMT).scalars().all()
+    return _prompt_list_response(prompts)
 
 
-@router.get("/", response_model=List[PromptResponse])
-async def get_user_prompts(
+@router.get("/", response_model=List[PromptListItem])
+def get_user_prompts(
     card_key: str,
     stage: str = None,
     db: Session = Depends(get_db)
@@ -47,17 +157,34 @@ async def get_user_prompts(
     """获取用户自定义提示词"""
     user = get_current_user(card_key, db)
     
-    query = db.query(CustomPrompt).filter(CustomPrompt.user_id == user.id)
-    
     if stage:
-        query = query.filter(CustomPrompt.stage == stage)
+        result = db.execute(_USER_STAGE_PROMPTS_STMT, {"uid": user.id, "b_stage": stage})
+    else:
+        result = db.execute(_USER_PROMPTS_STMT, {"uid": user.id})
     
-    prompts = query.all()
-    return prompts
+    prompts = result.scalars().all()
+    return _prompt_list_response(prompts)
+
+
+@router.get("/{prompt_id}", response_model=PromptResponse)
+def get_prompt(
+    prompt_id: int,
+    card_key: str,
+    db: Session = Depends(get_db)
+):
+    """获取单个提示词（含正文）"""
+    user = get_current_user(card_key, db)
+    
+    prompt = db.execute(_GET_PROMPT_STMT, {"pid": prompt_id, "uid": user.id}).scalar()
+    
+    if not prompt:
+        raise HTTPException(status_code=404, detail="提示词不存在")
+    
+    return prompt
 
 
 @router.post("/", response_model=PromptResponse)
-async def create_prompt(
+def create_prompt(
     card_key: str,
     prompt_data: PromptCreate,
     db: Session = Depends(get_db)
@@ -65,32 +192,33 @@ async def create_prompt(
     """创建自定义提示词"""
     user = get_current_user(card_key, db)
     
-    # 如果设置为默认,取消该阶段其他默认提示词
-    if prompt_data.is_default:
-        db.query(CustomPrompt).filter(
-            CustomPrompt.user_id == user.id,
-            CustomPrompt.stage == prompt_data.stage,
-            CustomPrompt.is_default == True
-        ).update({"is_default": False})
-    
+    # 时间戳在客户端填充，提交后无需再 refresh 读回
+    now = datetime.utcnow()
     prompt = CustomPrompt(
         user_id=user.id,
         name=prompt_data.name,
         stage=prompt_data.stage,
         content=prompt_data.content,
         is_default=prompt_data.is_default,
-        is_system=False
+        is_system=False,
+        created_at=now,
+        updated_at=now
     )
     
     db.add(prompt)
+    
+    # 如果设置为默认,取消该阶段其他默认提示词
+    if prompt_data.is_default:
+        db.flush()
+        _set_stage_default(db, user.id, prompt.stage, prompt.id)
+    
     db.commit()
-    db.refresh(prompt)
     
     return prompt
 
 
 @router.put("/{prompt_id}", response_model=PromptResponse)
-async def update_prompt(
+def update_prompt(
     prompt_id: int,
     card_key: str,
     prompt_data: PromptUpdate,
@@ -99,39 +227,43 @@ async def update_prompt(
     """更新提示词"""
     user = get_current_user(card_key, db)
     
-    prompt = db.query(CustomPrompt).filter(
+    # 更新字段
+    values = {
+        field: value
+        for field, value in (
+            ("name", prompt_data.name),
+            ("content", prompt_data.content),
+            ("is_default", prompt_data.is_default),
+        )
+        if value is not None
+    }
+    values["updated_at"] = datetime.utcnow()
+    
+    stmt = update(CustomPrompt).where(
         CustomPrompt.id == prompt_id,
         CustomPrompt.user_id == user.id
-    ).first()
+    ).values(**values).execution_options(synchronize_session=False)
+    
+    if db.get_bind().dialect.update_returning:
+        # 存在性检查、更新和读回合并为一条 UPDATE ... RETURNING
+        prompt = db.execute(stmt.returning(CustomPrompt)).scalar_one_or_none()
+    else:
+        prompt = db.get(CustomPrompt, prompt_id) if db.execute(stmt).rowcount else None
     
     if not prompt:
         raise HTTPException(status_code=404, detail="提示词不存在")
     
-    # 如果设置为默认,取消该阶段其他默认提示词
+    # 如果设置为默认,同时取消该阶段其他默认提示词
     if prompt_data.is_default:
-        db.query(CustomPrompt).filter(
-            CustomPrompt.user_id == user.id,
-            CustomPrompt.stage == prompt.stage,
-            CustomPrompt.is_default == True,
-            CustomPrompt.id != prompt_id
-        ).update({"is_default": False})
-    
-    # 更新字段
-    if prompt_data.name is not None:
-        prompt.name = prompt_data.name
-    if prompt_data.content is not None:
-        prompt.content = prompt_data.content
-    if prompt_data.is_default is not None:
-        prompt.is_default = prompt_data.is_default
+        _set_stage_default(db, user.id, prompt.stage, prompt_id)
     
     db.commit()
-    db.refresh(prompt)
     
     return prompt
 
 
 @router.delete("/{prompt_id}")
-async def delete_prompt(
+def delete_prompt(
     prompt_id: int,
     card_key: str,
     db: Session = Depends(get_db)
@@ -139,22 +271,23 @@ async def delete_prompt(
     """删除提示词"""
     user = get_current_user(card_key, db)
     
-    prompt = db.query(CustomPrompt).filter(
-        CustomPrompt.id == prompt_id,
-        CustomPrompt.user_id == user.id
-    ).first()
+    # 存在性检查与删除合并为一条 DELETE
+    deleted = db.execute(
+        _DELETE_PROMPT_STMT,
+        {"pid": prompt_id, "uid": user.id},
+        execution_options=_NO_SYNC
+    ).rowcount
     
-    if not prompt:
+    if not deleted:
         raise HTTPException(status_code=404, detail="提示词不存在")
     
-    db.delete(prompt)
     db.commit()
     
     return {"message": "提示词已删除"}
 
 
 @router.post("/{prompt_id}/set-default")
-async def set_default_prompt(
+def set_default_prompt(
     prompt_id: int,
     card_key: str,
     db: Session = Depends(get_db)
@@ -162,23 +295,15 @@ async def set_default_prompt(
     """设置默认提示词"""
     user = get_current_user(card_key, db)
     
-    prompt = db.query(CustomPrompt).filter(
-        CustomPrompt.id == prompt_id,
-        CustomPrompt.user_id == user.id
-    ).first()
+    updated = db.execute(
+        _SET_DEFAULT_BY_ID_STMT,
+        {"uid": user.id, "pid": prompt_id},
+        execution_options=_NO_SYNC
+    ).rowcount
     
-    if not prompt:
+    if not updated:
         raise HTTPException(status_code=404, detail="提示词不存在")
     
-    # 取消该阶段其他默认提示词
-    db.query(CustomPrompt).filter(
-        CustomPrompt.user_id == user.id,
-        CustomPrompt.stage == prompt.stage,
-        CustomPrompt.is_default == True
-    ).update({"is_default": False})
-    
-    # 设置为默认
-    prompt.is_default = True
     db.commit()
     
     return {"message": "已设置为默认提示词"}
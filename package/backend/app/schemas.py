@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
@@ -20,8 +20,7 @@ class UserResponse(BaseModel):
     usage_limit: int
     usage_count: int
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ModelConfig(BaseModel):
@@ -54,8 +53,7 @@ class SegmentResponse(BaseModel):
     created_at: datetime
     completed_at: Optional[datetime] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class SessionResponse(BaseModel):
@@ -73,8 +71,7 @@ class SessionResponse(BaseModel):
     updated_at: datetime
     completed_at: Optional[datetime] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class SessionDetailResponse(SessionResponse):
@@ -112,12 +109,13 @@ class ChangeLogResponse(BaseModel):
     changes_detail: Optional[Dict[str, Any]] = None
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ExportConfirmation(BaseModel):
     """导出确认"""
+    model_config = ConfigDict(defer_build=True)
+    
     session_id: str
     acknowledge_academic_integrity: bool
     export_format: str = Field(..., pattern="^(txt|docx|pdf)$")
@@ -125,6 +123,8 @@ class ExportConfirmation(BaseModel):
 
 class CardKeyGenerate(BaseModel):
     """生成卡密"""
+    model_config = ConfigDict(defer_build=True)
+    
     count: int = Field(1, ge=1, le=100)
     prefix: Optional[str] = None
 
@@ -144,6 +144,8 @@ class UserUsageUpdate(BaseModel):
 
 class DatabaseUpdateRequest(BaseModel):
     """数据库记录更新请求"""
+    model_config = ConfigDict(defer_build=True)
+    
     data: Dict[str, Any]
 
 
@@ -163,18 +165,25 @@ class PromptUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 
-class PromptResponse(BaseModel):
-    """提示词响应"""
+class PromptListItem(BaseModel):
+    """提示词列表项（不含正文）"""
     id: int
     user_id: Optional[int] = None
     name: str
     stage: str
-    content: str
     is_default: bool
     is_system: bool
     is_active: bool
     created_at: datetime
     updated_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+class PromptResponse(PromptListItem):
+    """提示词响应"""
+    content: str
+
+
+# 提示词列表的预构建适配器，列表接口直接用它序列化，避免每次响应重复校验
+PromptListAdapter = TypeAdapter(List[PromptListItem])
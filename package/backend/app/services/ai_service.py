@@ -1,13 +1,87 @@
-from typing import List, Dict, Optional
-import json
+from typing import List, Dict, Optional, Tuple
+from logging.handlers import QueueHandler, QueueListener
+import asyncio
+import atexit
+import functools
+import logging
+import queue
 import re
+import sys
+import time
+import httpx
+import orjson
 from openai import AsyncOpenAI
 from app.config import settings
 
 
+class _DeferredQueueHandler(QueueHandler):
+    """入队时不做任何格式化，消息拼接和 traceback 格式化都交给后台线程"""
+    
+    def prepare(self, record):
+        return record
+
+
+logger = logging.getLogger(__name__)
+# 与项目其余部分一样直接输出到标准输出；不向根 logger 传播，避免与 uvicorn 的日志配置重复输出
+# 事件循环中只把日志记录放入队列，格式化和写 stdout 都在后台线程完成，不阻塞其他请求
+if not logger.handlers:
+    _log_handler = logging.StreamHandler(sys.stdout)
+    _log_handler.setFormatter(logging.Formatter("%(message)s"))
+    _log_queue = queue.SimpleQueue()
+    _log_listener = QueueListener(_log_queue, _log_handler)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    logger.addHandler(_DeferredQueueHandler(_log_queue))
+    logger.propagate = False
+# AI_REQUEST_LOGGING 关闭时只输出错误，请求/响应详情的格式化开销完全跳过
+logger.setLevel(logging.DEBUG if settings.AI_REQUEST_LOGGING else logging.WARNING)
+
+# 请求/响应日志块的首尾分隔线，直接作为日志消息输出，无需逐条格式化
+_BANNER = "=" * 80
+_BANNER_OPEN = "\n" + _BANNER
+_BANNER_CLOSE = _BANNER + "\n"
+
+
+class _Preview:
+    """日志中的消息内容预览，截断推迟到日志线程格式化时才执行"""
+    
+    __slots__ = ("content", "limit")
+    
+    def __init__(self, content: str, limit: int):
+        self.content = content
+        self.limit = limit
+    
+    def __str__(self) -> str:
+        if len(self.content) > self.limit:
+            return self.content[:self.limit] + '...'
+        return self.content
+
+
 # 流式处理中用于检测跨块标签的缓冲区大小
 THINKING_TAG_BUFFER_SIZE = 20
 
+# 流式输出合并：累计达到字符数或距上次输出超过时间间隔（秒）才向下游输出一次，
+# 避免每个 token 都触发一次广播
+STREAM_COALESCE_CHARS = 8192
+STREAM_COALESCE_INTERVAL = 0.025
+
+# 预编译的正则表达式，避免每次调用都查询 re 模块的内部缓存
+# <think>...</think>、<thinking>...</thinking> 标签及其内容，或残留的单独标签，一次扫描全部匹配
+# DOTALL 使 . 匹配换行符
+_THINK_TAGS_RE = re.compile(r'<(think|thinking)>.*?</\1>|</?think(?:ing)?>', re.DOTALL | re.IGNORECASE)
+# 连续多个空行
+_BLANKS_RE = re.compile(r'\n\s*\n\s*\n')
+# 按连续片段匹配汉字/字母，计数时累加片段长度，不必为每个字符创建一个字符串对象
+_CHINESE_RUN_RE = re.compile(r'[\u4e00-\u9fff]+')
+_ENGLISH_RUN_RE = re.compile(r'[a-zA-Z]+')
+# 流式输出中的思考标签（think/thinking 两种写法合并为一个模式，忽略大小写）
+_OPEN_TAG_RE = re.compile(r'<think(?:ing)?>', re.IGNORECASE)
+_CLOSE_TAG_RE = re.compile(r'</think(?:ing)?>', re.IGNORECASE)
+# 思考标签内只需保留可能构成跨块结束标签的尾部
+_CLOSE_TAG_TAIL_SIZE = len('</thinking>') - 1
+# 句末标点，分句时标点归属前一句
+_SENTENCE_END_RE = re.compile(r'[。!?;]')
+
 
 def remove_thinking_tags(text: str) -> str:
     """移除 AI 模型输出的思考标签
@@ -24,24 +98,142 @@ def remove_thinking_tags(text: str) -> str:
     if not text:
         return text
     
-    # 移除 <think>...</think> 和 <thinking>...</thinking> 标签及其内容
-    # 使用 DOTALL 标志使 . 匹配换行符
-    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL | re.IGNORECASE)
-    text = re.sub(r'<thinking>.*?</thinking>', '', text, flags=re.DOTALL | re.IGNORECASE)
+    # 单次扫描移除 <think>/<thinking> 标签及其内容，以及可能残留的单独标签
+    # 大多数模型不输出思考标签，没有 '<' 时直接跳过正则替换
+    if '<' in text:
+        text = _THINK_TAGS_RE.sub('', text)
     
-    # 移除可能残留的单独标签
-    text = re.sub(r'</?think>', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'</?thinking>', '', text, flags=re.IGNORECASE)
-    
-    # 清理可能产生的多余空白
-    text = re.sub(r'\n\s*\n\s*\n', '\n\n', text)
+    # 清理可能产生的多余空白（少于三个换行时不可能出现连续空行）
+    if text.count('\n') >= 3:
+        text = _BLANKS_RE.sub('\n\n', text)
     
     return text.strip()
 
 
+# 附加在系统提示词之后的强制指令
+# 润色：英文输入
+_POLISH_SUFFIX_EN = """
+# CRITICAL INSTRUCTIONS (MUST FOLLOW):
+
+1. **LANGUAGE CONSISTENCY**:
+   - **INPUT IS ENGLISH -> OUTPUT MUST BE ENGLISH.**
+2. **FOCUS ON CURRENT INPUT ONLY**:
+   - You are processing a specific text segment. Treat it as a standalone, independent task.
+3. **NO SEMANTIC REDUNDANCY**:
+   - **Core Requirement**: Do not repeat the same meaning in different words within a paragraph.
+   - **Information Density**: Every sentence must provide new information or necessary logical deduction. Delete fluff or circular reasoning immediately.
+   - **Concise Expression**: Expand structure but maintain logical tightness. Do not pile up meaningless adjectives just to add length.
+4. **NO HISTORY REPETITION**:
+   - Do not output the original raw text. Do not repeat content from the conversation history.
+5. **STRUCTURAL INTEGRITY**:
+   - The number of output paragraphs must exactly match the input.
+6. **PURE OUTPUT**:
+   - Output ONLY the polished text.
+
+"""
+
+# 增强：中文输入
+_ENHANCE_SUFFIX_ZH = """
+# 关键指令（必须遵守）：
+1. **语言一致性**: 
+   - **输入是中文，输出必须是中文**。严禁将中文翻译成英文。
+2. **仅关注当前输入**: 你正在处理一个特定的文本片段。请将其视为一个独立的任务。
+3. **严禁语义重复**: 
+   - **核心要求**: 严禁在同一段落中用不同的措辞反复表达同一个意思。
+   - **信息密度**: 每一句话都必须提供新的信息或必要的逻辑推演。如果是废话或车轱辘话，请直接删除。
+   - **精炼表达**: 在扩充句式的同时，保持逻辑的紧凑性。不要为了凑字数而堆砌无意义的形容词。
+4. **严禁复述历史**: 不要输出原始文本。不要重复历史记录中的内容。
+5. **结构完整性**: 输出的段落数量必须与输入一致。
+6. **纯净输出**: 仅输出润色后的中文文本。
+"""
+
+# 感情文章润色：中英文均可
+_EMOTION_SUFFIX = """
+
+# 关键指令（必须遵守）：
+1. **语言一致性 (LANGUAGE CONSISTENCY)**: 
+   - **如果输入是中文，输出必须是中文**。严禁将中文翻译成英文。
+   - **如果输入是英文，输出必须是英文**。
+2. **仅关注当前输入**: 你正在处理一个特定的文本片段。请将其视为一个独立的任务。
+3. **严禁语义重复 (NO SEMANTIC REDUNDANCY)**: 
+   - **核心要求**: 严禁在同一段落中用不同的措辞反复表达同一个意思。
+   - **信息密度**: 每一句话都必须提供新的信息或必要的逻辑推演。如果是废话或车轱辘话，请直接删除。
+   - **精炼表达**: 在扩充句式的同时，保持逻辑的紧凑性。不要为了凑字数而堆砌无意义的形容词。
+4. **严禁复述历史**: 不要输出原始文本。不要重复历史记录中的内容。
+5. **结构完整性**: 输出的段落数量必须与输入一致。
+6. **纯净输出**: 仅输出润色后的文本。
+"""
+
+
+@functools.lru_cache(maxsize=32)
+def _compose_system_prompt(prompt: str, suffix: str) -> str:
+    """拼接系统提示词与强制指令
+    
+    同一会话的所有段落使用同一个提示词对象，缓存命中时无需重新拼接数 KB 的字符串。
+    """
+    return prompt + suffix
+
+
+# 进程内所有 OpenAI 客户端共享的 HTTP 连接池
+# SDK 默认只保留 20 个空闲连接且 5 秒后过期，并发用户较多时会频繁重新建立 TCP/TLS 连接
+# 与 SDK 自建客户端一样跟随重定向（兼容 http→https 或补全末尾斜杠的 base_url）
+_http_client = httpx.AsyncClient(
+    timeout=60.0,
+    follow_redirects=True,
+    limits=httpx.Limits(
+        max_connections=256,
+        max_keepalive_connections=128,
+        keepalive_expiry=30.0
+    )
+)
+
+
+@functools.lru_cache(maxsize=16)
+def _get_openai_client(api_key: str, base_url: str) -> AsyncOpenAI:
+    """按 (api_key, base_url) 复用 OpenAI 客户端，共享其连接池和 TLS 会话，避免每次都重新握手"""
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=60.0,
+        max_retries=2,  # 添加重试机制
+        http_client=_http_client
+    )
+
+
+async def close_http_client():
+    """关闭共享的 HTTP 连接池（应用关闭时调用）"""
+    await _http_client.aclose()
+
+
 class AIService:
     """AI 服务类"""
     
+    # 按 (model, api_key, base_url) 缓存的实例，超过上限时淘汰最早创建的
+    _CACHE: Dict[Tuple[str, str, str], "AIService"] = {}
+    _CACHE_MAX_SIZE = 64
+    
+    @classmethod
+    def get(
+        cls,
+        model: str,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None
+    ) -> "AIService":
+        """获取（复用）AI 服务实例，参数处理与构造函数一致"""
+        raw_base_url = base_url or settings.OPENAI_BASE_URL
+        key = (
+            model,
+            api_key or settings.OPENAI_API_KEY,
+            raw_base_url.rstrip("/") if raw_base_url else None
+        )
+        instance = cls._CACHE.get(key)
+        if instance is None:
+            instance = cls(model, api_key, base_url)
+            if len(cls._CACHE) >= cls._CACHE_MAX_SIZE:
+                cls._CACHE.pop(next(iter(cls._CACHE)))
+            cls._CACHE[key] = instance
+        return instance
+    
     def __init__(
         self,
         model: str,
@@ -63,22 +255,47 @@ class AIService:
             raise Exception("Base URL 未配置，无法初始化 AI 服务")
         
         try:
-            # 初始化 OpenAI 客户端
-            self.client = AsyncOpenAI(
-                api_key=self.api_key,
-                base_url=self.base_url,
-                timeout=60.0,
-                max_retries=2  # 添加重试机制
-            )
+            # 获取（复用）OpenAI 客户端
+            self.client = _get_openai_client(self.api_key, self.base_url)
             
-            # 启用所有API请求的日志记录
-            self._enable_logging = True
-            print(f"[INFO] AI Service 初始化成功: model={model}, base_url={self.base_url}")
+            # 是否记录API请求/响应详情（由 AI_REQUEST_LOGGING 控制）
+            self._enable_logging = logger.isEnabledFor(logging.DEBUG)
+            logger.debug("[INFO] AI Service 初始化成功: model=%s, base_url=%s", model, self.base_url)
         except Exception as e:
             error_msg = f"AI Service 初始化失败: {str(e)}"
-            print(f"[ERROR] {error_msg}")
+            logger.error("[ERROR] %s", error_msg)
             raise Exception(error_msg)
     
+    async def _stream_deltas(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int]
+    ):
+        """发起流式请求并逐个产出增量文本（原始 SSE 行直接用 orjson 解析）"""
+        async with self.client.chat.completions.with_streaming_response.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        ) as response:
+            async for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                data = orjson.loads(payload)
+                if data.get("error"):
+                    raise Exception(data["error"].get("message") or data["error"])
+                choices = data.get("choices")
+                if not choices:
+                    continue
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    yield content
+    
     async def stream_complete(
         self,
         messages: List[Dict[str, str]],
@@ -88,55 +305,79 @@ class AIService:
         """调用AI完成（流式）"""
         try:
             if self._enable_logging:
-                print("\n" + "="*80, flush=True)
-                print("[STREAM REQUEST] Base URL:", self.base_url, flush=True)
-                print("[STREAM REQUEST] Model:", self.model, flush=True)
-                print("[STREAM REQUEST] Temperature:", temperature, flush=True)
-                print("[STREAM REQUEST] Messages:", flush=True)
+                logger.debug(_BANNER_OPEN)
+                logger.debug("[STREAM REQUEST] Base URL: %s", self.base_url)
+                logger.debug("[STREAM REQUEST] Model: %s", self.model)
+                logger.debug("[STREAM REQUEST] Temperature: %s", temperature)
+                logger.debug("[STREAM REQUEST] Messages:")
                 for idx, msg in enumerate(messages):
-                    role = msg.get('role', 'unknown')
-                    content = msg.get('content', '')
-                    content_preview = content[:200] + '...' if len(content) > 200 else content
-                    print(f"  [{idx}] {role}: {content_preview}", flush=True)
-                print("="*80 + "\n", flush=True)
-
-            stream = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                stream=True
-            )
+                    role, content = msg["role"], msg["content"]
+                    logger.debug("  [%d] %s: %s", idx, role, _Preview(content, 200))
+                logger.debug(_BANNER_CLOSE)
 
-            full_response = ""  # 收集完整响应
+            response_parts = []  # 收集完整响应的各个片段，结束时一次性拼接
             in_thinking_tag = False  # 跟踪是否在思考标签内
             thinking_buffer = ""  # 暂存可能的思考内容
+            pending = []  # 待输出的可见内容
+            pending_len = 0
+            last_flush = time.monotonic()
             
-            async for chunk in stream:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    full_response += content
+            # 直接解析 SSE 行取出增量文本，跳过 SDK 对每个分块的 pydantic 模型构建
+            deltas = self._stream_deltas(messages, temperature, max_tokens).__aiter__()
+            next_delta = None  # 合并等待期间预先发起的读取
+            try:
+                while True:
+                    # 合并输出：积累足够内容或距上次输出超过间隔时才 yield
+                    # 有待输出内容时最多等到间隔结束，一段输出的末尾不会滞留到下一个分块到达才发出
+                    if pending:
+                        remaining = STREAM_COALESCE_INTERVAL - (time.monotonic() - last_flush)
+                        if pending_len < STREAM_COALESCE_CHARS and remaining > 0:
+                            next_delta = asyncio.ensure_future(deltas.__anext__())
+                            await asyncio.wait((next_delta,), timeout=remaining)
+                        if next_delta is None or not next_delta.done():
+                            yield "".join(pending)
+                            pending.clear()
+                            pending_len = 0
+                            last_flush = time.monotonic()
+                    
+                    try:
+                        content = await (next_delta if next_delta is not None else deltas.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        next_delta = None
+                    
+                    response_parts.append(content)
                     
                     # 检测和过滤思考标签
                     # 将内容添加到缓冲区以检测标签
                     thinking_buffer += content
                     
-                    # 检查是否进入思考标签
-                    if not in_thinking_tag and ('<think>' in thinking_buffer.lower() or '<thinking>' in thinking_buffer.lower()):
-                        in_thinking_tag = True
-                        # 输出标签之前的内容
-                        before_tag = re.split(r'<think>|<thinking>', thinking_buffer, flags=re.IGNORECASE)[0]
-                        if before_tag:
-                            yield before_tag
-                        thinking_buffer = ""
-                        continue
+                    # 检查是否进入思考标签（一次正则扫描覆盖两种写法，无需 lower() 复制缓冲区）
+                    # 先用 '<' 做廉价的预筛选，绝大多数块无需进入正则引擎
+                    if not in_thinking_tag:
+                        match = _OPEN_TAG_RE.search(thinking_buffer) if '<' in thinking_buffer else None
+                        if match:
+                            in_thinking_tag = True
+                            # 输出标签之前的内容
+                            before_tag = thinking_buffer[:match.start()]
+                            if before_tag:
+                                pending.append(before_tag)
+                                pending_len += len(before_tag)
+                            # 保留标签之后的内容，同一块中的结束标签也要检测，否则之后的回答会被全部隐藏
+                            thinking_buffer = thinking_buffer[match.end():]
                     
                     # 检查是否退出思考标签
-                    if in_thinking_tag and ('</think>' in thinking_buffer.lower() or '</thinking>' in thinking_buffer.lower()):
-                        in_thinking_tag = False
-                        # 清空缓冲区，跳过标签后的内容
-                        thinking_buffer = re.split(r'</think>|</thinking>', thinking_buffer, flags=re.IGNORECASE)[-1]
-                        continue
+                    if in_thinking_tag:
+                        match = None
+                        if '<' in thinking_buffer:
+                            for match in _CLOSE_TAG_RE.finditer(thinking_buffer):
+                                pass
+                        if match:
+                            in_thinking_tag = False
+                            # 清空缓冲区，只保留最后一个结束标签之后的内容
+                            thinking_buffer = thinking_buffer[match.end():]
+                            continue
                     
                     # 如果不在思考标签内，输出内容
                     if not in_thinking_tag:
@@ -144,32 +385,39 @@ class AIService:
                         if len(thinking_buffer) > THINKING_TAG_BUFFER_SIZE:
                             yield_content = thinking_buffer[:-THINKING_TAG_BUFFER_SIZE]
                             thinking_buffer = thinking_buffer[-THINKING_TAG_BUFFER_SIZE:]
-                            yield yield_content
+                            pending.append(yield_content)
+                            pending_len += len(yield_content)
                     else:
-                        # 在思考标签内，不输出
-                        thinking_buffer = ""
+                        # 在思考标签内，不输出；只保留尾部以检测跨块的结束标签，每块的扫描量与块大小成正比
+                        thinking_buffer = thinking_buffer[-_CLOSE_TAG_TAIL_SIZE:]
+            finally:
+                # 下游提前结束或出错时取消未完成的读取并关闭上游响应
+                if next_delta is not None:
+                    next_delta.cancel()
+                    await asyncio.wait((next_delta,))
+                await deltas.aclose()
             
             # 输出剩余缓冲区内容（如果不在思考标签内）
             if thinking_buffer and not in_thinking_tag:
-                yield thinking_buffer
+                pending.append(thinking_buffer)
+            if pending:
+                yield "".join(pending)
             
             # 流式响应完成后，记录完整响应（包含思考标签）
             if self._enable_logging:
-                print("\n" + "="*80, flush=True)
-                print("[STREAM RESPONSE] Complete Response (with thinking tags):", flush=True)
-                print(full_response, flush=True)
-                print("[STREAM RESPONSE] Total Length:", len(full_response), flush=True)
+                full_response = "".join(response_parts)
+                logger.debug(_BANNER_OPEN)
+                logger.debug("[STREAM RESPONSE] Complete Response (with thinking tags):")
+                logger.debug("%s", full_response)
+                logger.debug("[STREAM RESPONSE] Total Length: %d", len(full_response))
                 # 显示过滤后的长度
                 filtered = remove_thinking_tags(full_response)
-                print("[STREAM RESPONSE] Filtered Length:", len(filtered), flush=True)
-                print("="*80 + "\n", flush=True)
+                logger.debug("[STREAM RESPONSE] Filtered Length: %d", len(filtered))
+                logger.debug(_BANNER_CLOSE)
 
         except Exception as e:
-            if self._enable_logging:
-                print(f"[STREAM ERROR] Exception: {str(e)}", flush=True)
-                print(f"[STREAM ERROR] Exception Type: {type(e).__name__}", flush=True)
-                import traceback
-                print(f"[STREAM ERROR] Traceback:\n{traceback.format_exc()}", flush=True)
+            logger.error("[STREAM ERROR] Exception: %s", e)
+            logger.error("[STREAM ERROR] Exception Type: %s", type(e).__name__, exc_info=True)
             raise Exception(f"AI流式调用失败: {str(e)}")
 
     async def complete(
@@ -182,20 +430,18 @@ class AIService:
         try:
             # 记录请求日志
             if self._enable_logging:
-                print("\n" + "="*80, flush=True)
-                print("[AI REQUEST] Base URL:", self.base_url, flush=True)
-                print("[AI REQUEST] Model:", self.model, flush=True)
-                print("[AI REQUEST] Temperature:", temperature, flush=True)
-                print("[AI REQUEST] Max Tokens:", max_tokens, flush=True)
-                print("[AI REQUEST] Messages Count:", len(messages), flush=True)
-                print("[AI REQUEST] Messages Detail:", flush=True)
+                logger.debug(_BANNER_OPEN)
+                logger.debug("[AI REQUEST] Base URL: %s", self.base_url)
+                logger.debug("[AI REQUEST] Model: %s", self.model)
+                logger.debug("[AI REQUEST] Temperature: %s", temperature)
+                logger.debug("[AI REQUEST] Max Tokens: %s", max_tokens)
+                logger.debug("[AI REQUEST] Messages Count: %d", len(messages))
+                logger.debug("[AI REQUEST] Messages Detail:")
                 for idx, msg in enumerate(messages):
-                    role = msg.get('role', 'unknown')
-                    content = msg.get('content', '')
-                    content_preview = content[:300] + '...' if len(content) > 300 else content
-                    print(f"  Message [{idx}] Role: {role}", flush=True)
-                    print(f"  Content: {content_preview}", flush=True)
-                print("="*80 + "\n", flush=True)
+                    role, content = msg["role"], msg["content"]
+                    logger.debug("  Message [%d] Role: %s", idx, role)
+                    logger.debug("  Content: %s", _Preview(content, 300))
+                logger.debug(_BANNER_CLOSE)
 
             response = await self.client.chat.completions.create(
                 model=self.model,
@@ -213,33 +459,30 @@ class AIService:
 
             # 记录响应日志
             if self._enable_logging:
-                print("\n" + "="*80, flush=True)
-                print("[AI RESPONSE] ID:", response.id, flush=True)
-                print("[AI RESPONSE] Model:", response.model, flush=True)
-                print("[AI RESPONSE] Created:", response.created, flush=True)
+                logger.debug(_BANNER_OPEN)
+                logger.debug("[AI RESPONSE] ID: %s", response.id)
+                logger.debug("[AI RESPONSE] Model: %s", response.model)
+                logger.debug("[AI RESPONSE] Created: %s", response.created)
                 if response.usage:
-                    print("[AI RESPONSE] Token Usage:", flush=True)
-                    print(f"  Prompt Tokens: {response.usage.prompt_tokens}", flush=True)
-                    print(f"  Completion Tokens: {response.usage.completion_tokens}", flush=True)
-                    print(f"  Total Tokens: {response.usage.total_tokens}", flush=True)
-                print("[AI RESPONSE] Raw Content Length:", len(raw_content), flush=True)
-                print("[AI RESPONSE] Filtered Content Length:", len(filtered_content), flush=True)
+                    logger.debug("[AI RESPONSE] Token Usage:")
+                    logger.debug("  Prompt Tokens: %s", response.usage.prompt_tokens)
+                    logger.debug("  Completion Tokens: %s", response.usage.completion_tokens)
+                    logger.debug("  Total Tokens: %s", response.usage.total_tokens)
+                logger.debug("[AI RESPONSE] Raw Content Length: %d", len(raw_content))
+                logger.debug("[AI RESPONSE] Filtered Content Length: %d", len(filtered_content))
                 if raw_content != filtered_content:
-                    print("[AI RESPONSE] ⚠️  Thinking tags detected and removed", flush=True)
-                print("[AI RESPONSE] Content:", flush=True)
-                print(filtered_content, flush=True)
-                print("="*80 + "\n", flush=True)
+                    logger.debug("[AI RESPONSE] ⚠️  Thinking tags detected and removed")
+                logger.debug("[AI RESPONSE] Content:")
+                logger.debug("%s", filtered_content)
+                logger.debug(_BANNER_CLOSE)
 
             return filtered_content
 
         except Exception as e:
-            if self._enable_logging:
-                print("\n" + "="*80, flush=True)
-                print("[AI ERROR] Exception:", str(e), flush=True)
-                print("[AI ERROR] Exception Type:", type(e).__name__, flush=True)
-                import traceback
-                print(f"[AI ERROR] Traceback:\n{traceback.format_exc()}", flush=True)
-                print("="*80 + "\n", flush=True)
+            logger.error(_BANNER_OPEN)
+            logger.error("[AI ERROR] Exception: %s", e)
+            logger.error("[AI ERROR] Exception Type: %s", type(e).__name__, exc_info=True)
+            logger.error(_BANNER_CLOSE)
             raise Exception(f"AI调用失败: {str(e)}")
     
     async def polish_text(
@@ -249,10 +492,9 @@ class AIService:
         history: Optional[List[Dict[str, str]]] = None,
         stream: bool = False
     ):
-        is_chinese = count_chinese_characters(text) > len(text) * 0.1
+        is_chinese = is_chinese_text(text)
         if  is_chinese:
-            if self._enable_logging:
-                print(f"[ENHANCE] Detected non-Chinese input. Skipping AI processing.", flush=True)
+            logger.debug("[ENHANCE] Detected non-Chinese input. Skipping AI processing.")
             if stream:
                 # 如果前端请求流式，我们需要手动造一个异步生成器，把原文"吐"出去
                 async def _pseudo_stream():
@@ -261,37 +503,20 @@ class AIService:
             else:
                 # 如果是非流式，直接返回字符串
                 return text
-        # 浅拷贝足够
-        messages = list(history or [])
-        system_instruction_suffix ="""
-# CRITICAL INSTRUCTIONS (MUST FOLLOW):
-
-1. **LANGUAGE CONSISTENCY**:
-   - **INPUT IS ENGLISH -> OUTPUT MUST BE ENGLISH.**
-2. **FOCUS ON CURRENT INPUT ONLY**:
-   - You are processing a specific text segment. Treat it as a standalone, independent task.
-3. **NO SEMANTIC REDUNDANCY**:
-   - **Core Requirement**: Do not repeat the same meaning in different words within a paragraph.
-   - **Information Density**: Every sentence must provide new information or necessary logical deduction. Delete fluff or circular reasoning immediately.
-   - **Concise Expression**: Expand structure but maintain logical tightness. Do not pile up meaningless adjectives just to add length.
-4. **NO HISTORY REPETITION**:
-   - Do not output the original raw text. Do not repeat content from the conversation history.
-5. **STRUCTURAL INTEGRITY**:
-   - The number of output paragraphs must exactly match the input.
-6. **PURE OUTPUT**:
-   - Output ONLY the polished text.
-
-"""
-        full_system_prompt = prompt + system_instruction_suffix
-
-        messages.append({
-            "role": "system",
-            "content": full_system_prompt
-        })
-        messages.append({
-            "role": "user",
-            "content": f"Please polish the following text segment (Ensure language consistency, do not repeat history):\n\n<<START>>\n{text}\n<<END>>"
-        })
+        full_system_prompt = _compose_system_prompt(prompt, _POLISH_SUFFIX_EN)
+        
+        # 历史消息在前，一次性构建消息列表（浅拷贝足够）
+        messages = [
+            *(history or ()),
+            {
+                "role": "system",
+                "content": full_system_prompt
+            },
+            {
+                "role": "user",
+                "content": f"Please polish the following text segment (Ensure language consistency, do not repeat history):\n\n<<START>>\n{text}\n<<END>>"
+            }
+        ]
         
         if stream:
             return self.stream_complete(messages)
@@ -305,10 +530,9 @@ class AIService:
         stream: bool = False
     ):
         """增强文本原创性和学术表达 - [强化版防重复 + 强制语言一致性]"""
-        is_chinese = count_chinese_characters(text) > len(text) * 0.1
+        is_chinese = is_chinese_text(text)
         if  not is_chinese:
-            if self._enable_logging:
-                print(f"[ENHANCE] Detected non-Chinese input. Skipping AI processing.", flush=True)
+            logger.debug("[ENHANCE] Detected non-Chinese input. Skipping AI processing.")
             if stream:
                 # 如果前端请求流式，我们需要手动造一个异步生成器，把原文"吐"出去
                 async def _pseudo_stream():
@@ -317,32 +541,20 @@ class AIService:
             else:
                 # 如果是非流式，直接返回字符串
                 return text
-        # 浅拷贝足够
-        messages = list(history or [])
+        full_system_prompt = _compose_system_prompt(prompt, _ENHANCE_SUFFIX_ZH)
         
-        system_instruction_suffix = """
-# 关键指令（必须遵守）：
-1. **语言一致性**: 
-   - **输入是中文，输出必须是中文**。严禁将中文翻译成英文。
-2. **仅关注当前输入**: 你正在处理一个特定的文本片段。请将其视为一个独立的任务。
-3. **严禁语义重复**: 
-   - **核心要求**: 严禁在同一段落中用不同的措辞反复表达同一个意思。
-   - **信息密度**: 每一句话都必须提供新的信息或必要的逻辑推演。如果是废话或车轱辘话，请直接删除。
-   - **精炼表达**: 在扩充句式的同时，保持逻辑的紧凑性。不要为了凑字数而堆砌无意义的形容词。
-4. **严禁复述历史**: 不要输出原始文本。不要重复历史记录中的内容。
-5. **结构完整性**: 输出的段落数量必须与输入一致。
-6. **纯净输出**: 仅输出润色后的中文文本。
-"""
-        full_system_prompt = prompt + system_instruction_suffix
-
-        messages.append({
-            "role": "system",
-            "content": full_system_prompt
-        })
-        messages.append({
-            "role": "user",
-            "content": f"请增强以下文本片段（确保语言与输入一致，不重复历史内容）：\n\n<<START>>\n{text}\n<<END>>"
-        })
+        # 历史消息在前，一次性构建消息列表（浅拷贝足够）
+        messages = [
+            *(history or ()),
+            {
+                "role": "system",
+                "content": full_system_prompt
+            },
+            {
+                "role": "user",
+                "content": f"请增强以下文本片段（确保语言与输入一致，不重复历史内容）：\n\n<<START>>\n{text}\n<<END>>"
+            }
+        ]
         
         if stream:
             return self.stream_complete(messages)
@@ -356,35 +568,21 @@ class AIService:
         stream: bool = False
     ):
         """感情文章润色"""
-        # 浅拷贝足够
-        messages = list(history or [])
-        
         # --- 核心修改：统一使用强力的防重复指令 ---
-        system_instruction_suffix = """
-
-# 关键指令（必须遵守）：
-1. **语言一致性 (LANGUAGE CONSISTENCY)**: 
-   - **如果输入是中文，输出必须是中文**。严禁将中文翻译成英文。
-   - **如果输入是英文，输出必须是英文**。
-2. **仅关注当前输入**: 你正在处理一个特定的文本片段。请将其视为一个独立的任务。
-3. **严禁语义重复 (NO SEMANTIC REDUNDANCY)**: 
-   - **核心要求**: 严禁在同一段落中用不同的措辞反复表达同一个意思。
-   - **信息密度**: 每一句话都必须提供新的信息或必要的逻辑推演。如果是废话或车轱辘话，请直接删除。
-   - **精炼表达**: 在扩充句式的同时，保持逻辑的紧凑性。不要为了凑字数而堆砌无意义的形容词。
-4. **严禁复述历史**: 不要输出原始文本。不要重复历史记录中的内容。
-5. **结构完整性**: 输出的段落数量必须与输入一致。
-6. **纯净输出**: 仅输出润色后的文本。
-"""
-        full_system_prompt = prompt + system_instruction_suffix
-
-        messages.append({
-            "role": "system",
-            "content": full_system_prompt
-        })
-        messages.append({
-            "role": "user",
-            "content": f"请润色以下情感文本片段（确保不重复）：\n\n<<START>>\n{text}\n<<END>>"
-        })
+        full_system_prompt = _compose_system_prompt(prompt, _EMOTION_SUFFIX)
+        
+        # 历史消息在前，一次性构建消息列表（浅拷贝足够）
+        messages = [
+            *(history or ()),
+            {
+                "role": "system",
+                "content": full_system_prompt
+            },
+            {
+                "role": "user",
+                "content": f"请润色以下情感文本片段（确保不重复）：\n\n<<START>>\n{text}\n<<END>>"
+            }
+        ]
         
         if stream:
             return self.stream_complete(messages)
@@ -396,23 +594,20 @@ class AIService:
         compression_prompt: str
     ) -> str:
         """压缩历史会话"""
-        # 只提取assistant消息的内容进行压缩
-        assistant_contents = [
-            msg['content'] 
-            for msg in history 
-            if msg.get('role') == 'assistant' and msg.get('content')
-        ]
-        
-        # 如果有system消息（已压缩的内容），也包含进来
-        system_contents = [
-            msg['content']
-            for msg in history
-            if msg.get('role') == 'system' and msg.get('content')
-        ]
-        
-        # 合并所有内容
-        all_contents = system_contents + assistant_contents
-        history_text = "\n\n---段落分隔---\n\n".join(all_contents)
+        # 只提取assistant消息以及system消息（已压缩的内容）进行压缩
+        # 单次遍历分类，拼接时保持"先system后assistant"的顺序
+        system_contents: List[str] = []
+        assistant_contents: List[str] = []
+        for msg in history:
+            content = msg.get('content')
+            if not content:
+                continue
+            role = msg.get('role')
+            if role == 'assistant':
+                assistant_contents.append(content)
+            elif role == 'system':
+                system_contents.append(content)
+        history_text = "\n\n---段落分隔---\n\n".join(system_contents + assistant_contents)
         
         messages = [
             {
@@ -432,8 +627,18 @@ def count_chinese_characters(text: str) -> int:
     """统计汉字数量"""
     if not text:
         return 0
-    chinese_pattern = re.compile(r'[\u4e00-\u9fff]')
-    return len(chinese_pattern.findall(text))
+    return sum(map(len, _CHINESE_RUN_RE.findall(text)))
+
+
+def is_chinese_text(text: str, threshold: float = 0.1) -> bool:
+    """判断汉字占比是否超过阈值，超过后立即返回，无需统计全文"""
+    limit = len(text) * threshold
+    count = 0
+    for match in _CHINESE_RUN_RE.finditer(text):
+        count += match.end() - match.start()
+        if count > limit:
+            return True
+    return False
 
 
 def count_text_length(text: str) -> int:
@@ -444,8 +649,23 @@ def count_text_length(text: str) -> int:
     if chinese_count > 0:
         return chinese_count
     # 纯英文文本，统计字母数量
-    english_pattern = re.compile(r'[a-zA-Z]')
-    return len(english_pattern.findall(text))
+    return _count_english_letters(text)
+
+
+def _count_english_letters(text: str) -> int:
+    """统计英文字母数量"""
+    return sum(map(len, _ENGLISH_RUN_RE.findall(text)))
+
+
+def _iter_sentences(text: str):
+    """按句末标点逐句产出（含标点），直接切片原文，不生成交替的文本/标点列表"""
+    start = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        end = match.end()
+        yield text[start:end]
+        start = end
+    if start < len(text):
+        yield text[start:]
 
 
 def split_text_into_segments(text: str, max_chars: int = 500) -> List[str]:
@@ -460,34 +680,43 @@ def split_text_into_segments(text: str, max_chars: int = 500) -> List[str]:
             continue
         
         # 如果段落不超过最大字符数,直接添加
-        if count_text_length(para) <= max_chars:
+        # count_text_length 只统计部分字符，结果不会超过 len(para)，较短的段落无需扫描
+        if len(para) <= max_chars or count_text_length(para) <= max_chars:
             segments.append(para)
         else:
             # 段落过长,按句子分割
-            sentences = re.split(r'([。!?;])', para)
-            current_segment = ""
+            # 当前片段的句子列表，切分时一次性拼接
+            current_parts = []
+            # 分别累计当前片段的汉字数和字母数，避免每加一句都重新统计整个片段
+            # （count_text_length 有汉字时取汉字数，否则取字母数，两者分开累计才能保持一致）
+            current_chinese = current_english = 0
             
-            for i in range(0, len(sentences), 2):
-                sentence = sentences[i]
-                if i + 1 < len(sentences):
-                    sentence += sentences[i + 1]  # 加上标点
+            for sentence in _iter_sentences(para):
+                sentence_chinese = count_chinese_characters(sentence)
+                sentence_english = _count_english_letters(sentence)
+                merged_chinese = current_chinese + sentence_chinese
+                merged_length = merged_chinese or current_english + sentence_english
                 
-                if count_text_length(current_segment + sentence) <= max_chars:
-                    current_segment += sentence
+                if merged_length <= max_chars:
+                    current_parts.append(sentence)
+                    current_chinese = merged_chinese
+                    current_english += sentence_english
                 else:
+                    current_segment = "".join(current_parts)
                     if current_segment:
                         segments.append(current_segment)
-                    current_segment = sentence
+                    current_parts = [sentence]
+                    current_chinese = sentence_chinese
+                    current_english = sentence_english
             
+            current_segment = "".join(current_parts)
             if current_segment:
                 segments.append(current_segment)
     
     return segments
 
 
-def get_default_polish_prompt() -> str:
-    """专注英文内容"""
-    return """
+_DEFAULT_POLISH_PROMPT = """
 # Role
 You are a "Style Mimicry Expert" specializing in writing authentic, human-like technical English.
 
@@ -560,9 +789,12 @@ AI is always confident ("This proves X"). Humans are cautious.
 """
 
 
-def get_default_enhance_prompt() -> str:
-    """获取默认增强提示词 - 已优化语言一致性"""
-    return """
+def get_default_polish_prompt() -> str:
+    """专注英文内容"""
+    return _DEFAULT_POLISH_PROMPT
+
+
+_DEFAULT_ENHANCE_PROMPT = """
 # 角色 (Role)
 你现在扮演一个“风格拟态专家”。你的核心任务是接收一段原文，将其改写成一种与人类写作风格高度一致、极难被AI检测工具识别的文本。
 
@@ -687,9 +919,12 @@ def get_default_enhance_prompt() -> str:
 """
 
 
-def get_emotion_polish_prompt() -> str:
-    """获取感情文章润色提示词"""
-    return """
+def get_default_enhance_prompt() -> str:
+    """获取默认增强提示词 - 已优化语言一致性"""
+    return _DEFAULT_ENHANCE_PROMPT
+
+
+_EMOTION_POLISH_PROMPT = """
 # 角色 (Role)
 你是一位深耕行业多年、极具批判性思维的资深行业观察家。你既拥有深厚的专业积淀，又极其厌恶教条化的书面辞令。你现在的任务是将文本转化为一种“深度思考的口语流”——这是一种在私下高层研讨会或深度访谈中才会出现的语言风格：专业、直接、带有个人思考的粗糙感，且完全屏蔽AI那种圆滑、均衡的机器味。你不是在“写作”，而是在对同行进行一次真实、坦率的“深度拆解”。
 
@@ -776,9 +1011,12 @@ def get_emotion_polish_prompt() -> str:
 """
 
 
-def get_compression_prompt() -> str:
-    """获取压缩提示词"""
-    return """你的任务是压缩历史会话内容,提取关键信息以减少token使用。
+def get_emotion_polish_prompt() -> str:
+    """获取感情文章润色提示词"""
+    return _EMOTION_POLISH_PROMPT
+
+
+_COMPRESSION_PROMPT = """你的任务是压缩历史会话内容,提取关键信息以减少token使用。
 
 压缩要求:
 1. 保留论文的关键术语、核心观点和重要数据
@@ -789,4 +1027,9 @@ def get_compression_prompt() -> str:
 注意:
 - 这个压缩内容仅作为历史上下文,不会出现在最终论文中
 - 压缩比例应该至少达到50%
-- 只返回压缩后的内容,不要添加说明，不要附加任何解释、注释或标签"""
\ No newline at end of file
+- 只返回压缩后的内容,不要添加说明，不要附加任何解释、注释或标签"""
+
+
+def get_compression_prompt() -> str:
+    """获取压缩提示词"""
+    return _COMPRESSION_PROMPT
\ No newline at end of file
@@ -34,28 +34,28 @@ class OptimizationService:
     def _init_ai_services(self):
         """初始化AI服务"""
         # 润色服务
-        self.polish_service = AIService(
+        self.polish_service = AIService.get(
             model=self.session_obj.polish_model or settings.POLISH_MODEL,
             api_key=self.session_obj.polish_api_key or settings.POLISH_API_KEY,
             base_url=self.session_obj.polish_base_url or settings.POLISH_BASE_URL
         )
         
         # 增强服务
-        self.enhance_service = AIService(
+        self.enhance_service = AIService.get(
             model=self.session_obj.enhance_model or settings.ENHANCE_MODEL,
             api_key=self.session_obj.enhance_api_key or settings.ENHANCE_API_KEY,
             base_url=self.session_obj.enhance_base_url or settings.ENHANCE_BASE_URL
         )
         
         # 感情文章润色服务
-        self.emotion_service = AIService(
+        self.emotion_service = AIService.get(
             model=self.session_obj.emotion_model or settings.POLISH_MODEL,
             api_key=self.session_obj.emotion_api_key or settings.POLISH_API_KEY,
             base_url=self.session_obj.emotion_base_url or settings.POLISH_BASE_URL
         )
         
         # 压缩服务
-        self.compression_service = AIService(
+        self.compression_service = AIService.get(
             model=settings.COMPRESSION_MODEL,
             api_key=settings.COMPRESSION_API_KEY or settings.OPENAI_API_KEY,
             base_url=settings.COMPRESSION_BASE_URL or settings.OPENAI_BASE_URL
@@ -0,0 +1,61 @@
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy.orm import Session, make_transient_to_detached
+from app.config import settings
+from app.models.models import User
+
+# 卡密 -> 用户的进程内缓存，短时间内重复请求无需再查询 users 表
+# 缓存只在本进程内有效：多 worker 部署时，其他进程中的缓存最长在 USER_CACHE_TTL 秒后才会过期
+USER_CACHE_MAXSIZE = 2048
+
+# 卡密 -> (过期时间, 用户列快照)
+_user_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_user_cache_lock = threading.Lock()
+
+
+def cache_user(card_key: str, user: User, keep_expiry: bool = False):
+    """缓存用户的列快照（不缓存 ORM 对象本身，避免跨会话共享）
+
+    keep_expiry 为 True 时只替换已有缓存项的快照，沿用原来的过期时间；缓存项已失效时不再写入。
+    """
+    ttl = settings.USER_CACHE_TTL
+    if ttl <= 0:
+        return
+
+    snapshot = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+    now = time.monotonic()
+    with _user_cache_lock:
+        if keep_expiry:
+            cached = _user_cache.get(card_key)
+            if cached and cached[0] > now:
+                _user_cache[card_key] = (cached[0], snapshot)
+            return
+        if card_key not in _user_cache and len(_user_cache) >= USER_CACHE_MAXSIZE:
+            # 先清理过期项，仍然满时淘汰最早写入的一项
+            for key in [k for k, (expires_at, _) in _user_cache.items() if expires_at <= now]:
+                del _user_cache[key]
+            if len(_user_cache) >= USER_CACHE_MAXSIZE:
+                del _user_cache[next(iter(_user_cache))]
+        _user_cache[card_key] = (now + ttl, snapshot)
+
+
+def get_cached_user(card_key: str, db: Session) -> Optional[User]:
+    """从缓存恢复用户，并在不查询数据库的前提下挂到当前会话"""
+    with _user_cache_lock:
+        cached = _user_cache.get(card_key)
+    if not cached or cached[0] <= time.monotonic():
+        return None
+
+    user = User(**cached[1])
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+def invalidate_user_cache(card_key: Optional[str] = None):
+    """用户被禁用、删除或修改后清除缓存；不传卡密时清空全部"""
+    with _user_cache_lock:
+        if card_key is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(card_key, None)
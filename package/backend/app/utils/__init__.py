@@ -5,6 +5,8 @@ from app.utils.auth import (
     generate_session_id,
     verify_password,
     get_password_hash,
+    verify_password_async,
+    get_password_hash_async,
     create_access_token,
     verify_token
 )
@@ -15,6 +17,8 @@ __all__ = [
     "generate_session_id",
     "verify_password",
     "get_password_hash",
+    "verify_password_async",
+    "get_password_hash_async",
     "create_access_token",
     "verify_token"
 ]
@@ -1,19 +1,38 @@
+import asyncio
 import secrets
 import string
-from datetime import datetime, timedelta
+import time
+from datetime import timedelta
 from typing import Optional
-from jose import JWTError, jwt
+import jwt
+from jwt import PyJWTError as JWTError
 from passlib.context import CryptContext
 from app.config import settings
 
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# 卡密字符表
+CARD_KEY_CHARS = string.ascii_uppercase + string.digits
+# 小于该值的随机字节对字符表长度取模是均匀分布的（36 * 7 = 252）
+_CARD_KEY_BYTE_LIMIT = 256 - 256 % len(CARD_KEY_CHARS)
+
+# 未指定有效期时访问令牌的默认有效期（秒）
+DEFAULT_TOKEN_EXPIRE_SECONDS = 15 * 60
+
 
 def generate_card_key(length: int = 16, prefix: str = "") -> str:
     """生成卡密"""
-    chars = string.ascii_uppercase + string.digits
-    random_part = ''.join(secrets.choice(chars) for _ in range(length))
+    # 一次性读取一批随机字节再映射到字符表，避免逐字符调用 secrets.choice；
+    # 丢弃超出均匀范围的字节，保证每个字符等概率
+    chars = []
+    while len(chars) < length:
+        chars.extend(
+            CARD_KEY_CHARS[byte % len(CARD_KEY_CHARS)]
+            for byte in secrets.token_bytes(length)
+            if byte < _CARD_KEY_BYTE_LIMIT
+        )
+    random_part = ''.join(chars[:length])
     if prefix:
         return f"{prefix}-{random_part}"
     return random_part
@@ -30,23 +49,35 @@ def generate_session_id() -> str:
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """验证密码"""
+    """验证密码
+    
+    bcrypt 单次耗时数十到数百毫秒，只能在同步路由（线程池）中调用；
+    async 路由中请使用 verify_password_async，避免阻塞事件循环。
+    """
     return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    """哈希密码"""
+    """哈希密码（同 verify_password，async 路由中请使用 get_password_hash_async）"""
     return pwd_context.hash(password)
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """在线程池中验证密码，不阻塞事件循环"""
+    return await asyncio.to_thread(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """在线程池中哈希密码，不阻塞事件循环"""
+    return await asyncio.to_thread(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """创建访问令牌"""
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # exp 直接使用整数时间戳，无需构造 datetime 再由 jwt 库转换
+    expires_seconds = int(expires_delta.total_seconds()) if expires_delta else DEFAULT_TOKEN_EXPIRE_SECONDS
+    to_encode["exp"] = int(time.time()) + expires_seconds
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
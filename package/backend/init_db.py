@@ -172,7 +172,8 @@ def main():
     print("初始化数据库...")
     print("=" * 60)
     try:
-        init_db()
+        # 独立运行时同步创建索引，确保脚本结束前索引已就绪
+        init_db(background_indexes=False)
     except Exception as e:
         print(f"\n❌ 数据库初始化失败: {str(e)}")
         import traceback
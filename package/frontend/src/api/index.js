@@ -74,6 +74,7 @@ export const promptsAPI = {
     api.get('/prompts/', {
       params: stage ? { stage } : {},
     }),
+  getPrompt: (promptId) => api.get(`/prompts/${promptId}`),
   createPrompt: (data) => api.post('/prompts/', data),
   updatePrompt: (promptId, data) => api.put(`/prompts/${promptId}`, data),
   deletePrompt: (promptId) => api.delete(`/prompts/${promptId}`),